@@ -1,26 +1,66 @@
 import streamlit as st
 import pandas as pd
-import base64
 import geopandas as gpd
 import folium
-from streamlit_folium import st_folium
 import streamlit.components.v1 as components
 from datetime import datetime
-from scipy.stats import zscore
-import json
+from pathlib import Path
+import numpy as np
+from scipy.stats import rankdata
+import orjson
+import hashlib
 from folium.plugins import Fullscreen
-import plotly.express as px
+from branca.colormap import StepColormap
+from branca.utilities import color_brewer
 
 # This Experience Builder App is hosted on ArcGIS Online (https://usaid.maps.arcgis.com/). 
 experience_builder_url = r'https://experience.arcgis.com/experience/7a2860e06a54437091b1cfa05ed389a9'
 
+# The commune GeoJSON ships next to this script, so it is read from disk instead of being downloaded from GitHub on every cold start.
+geojson_path = str(Path(__file__).parent / 'MadagascarCommunes_VI_Analysis_v3.geojson')
 # The following variables are URL references that will need to be updated if this python script is cloned in another GitHub Repo. 
-geojson_path = r'https://github.com/GSinger-Abt/streamlit_abt/raw/main/MadagascarCommunes_VI_Analysis_v3.geojson'
 codebook_url = "https://github.com/GSinger-Abt/streamlit_abt/raw/main/20240124_Vulnerability%20Index%20Data%20Dictionary_Revised.xlsx"
 instructions_url = "https://raw.githubusercontent.com/GSinger-Abt/streamlit_abt/main/20240124_Readme%201_Final.pdf"
 readme_url = "https://raw.githubusercontent.com/GSinger-Abt/streamlit_abt/main/20240124_README%202%20_Final.pdf"
 logo_url = r'https://github.com/GSinger-Abt/streamlit_abt/raw/main/StreamlitApp_Logos.jpg'
 
+# The following map settings are the same for every map, so they are defined once here rather than inside render_map.
+# Esri basemap and reference (labels) tile layers
+esri_satellite_tiles = dict(
+    tiles = 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
+    attr = 'Esri',
+    name = 'Esri Satellite',
+    overlay = False,
+    control = True
+)
+esri_labels_tiles = dict(
+    tiles = 'https://services.arcgisonline.com/ArcGIS/rest/services/Reference/World_Boundaries_and_Places/MapServer/tile/{z}/{y}/{x}',
+    attr = 'Esri',
+    name = 'Esri World Boundaries and Places',
+    overlay = True,
+    show = True,
+    control = True
+)
+# Choropleth fill colours, one per decile of the index of need percentile
+percentile_colors = color_brewer('RdYlBu_r', n=10)
+# Custom CSS style for the legend control
+legend_style = """
+<style>
+    .leaflet-control.legend {
+        background-color: rgba(0,0,0,0.6);  /* Background color */
+        color: white; /* Text color */
+        border: 1px solid #333;
+        border-radius: 2px;
+        padding: 2px;
+    }
+
+    .leaflet-control.legend .key {
+      fill: white; /* Text color within the key class*/
+    }
+
+</style>
+"""
+
 st.set_page_config(
     page_title='Madagascar - Weighted Index of Need (IoN) Explorer',
     page_icon="🗺️",
@@ -77,12 +117,23 @@ st.link_button("Download Full Instructions (.pdf)", instructions_url, help=None,
 st.link_button("Download Data Dictionary (.xlsx)", codebook_url, help=None, type='secondary')
 st.link_button("Download Read Me for Advanced Users (.pdf)", readme_url, help=None, type='secondary')
 
-@st.cache_data  # 👈 Add the caching decorator
+# Cached as a shared resource (no pickle copy per rerun); the frame is only read from after loading, never modified
+@st.cache_resource
 def load_geopandas_df(geojson_path):
-    ''' This function loads a geopandas datframe based on a geojson URL.'''
+    ''' This function loads a geopandas dataframe from the local MadagascarCommunes_VI_Analysis_v3.geojson next to this script.
+    It drops incomplete rows, simplifies the commune polygons and snaps their coordinates for web display, and stores the repeated
+    admin labels as categories.'''
     # Load Dataframe with Initial Index of Need (Default Weights = 0.1)
-    df = gpd.read_file(geojson_path)
+    df = gpd.read_file(geojson_path, engine='pyogrio', use_arrow=True)
     df.dropna(inplace=True)
+    # Simplify the commune polygons once for web display (tolerance in degrees, ~100m; invisible at zoom 7)
+    df['geometry'] = df.geometry.simplify(tolerance=0.001, preserve_topology=True)
+    # Snap coordinates to a 0.0001 degree (~11m) grid so the embedded GeoJSON carries 4 decimals instead of ~15
+    df['geometry'] = df.geometry.set_precision(0.0001)
+    # Store the repeated admin labels as categories. The indicators stay float64 because the tables show these source values;
+    # only the z-score matrix is float32 (see load_zscore_matrix)
+    category_columns = ['ADM1_PCODE','ADM1_EN','ADM1_TYPE','ADM2_PCODE','ADM2_EN','ADM2_TYPE','ADM3_TYPE']
+    df[category_columns] = df[category_columns].astype('category')
     return(df)
     
 # Define Processing Column Groups
@@ -128,122 +179,149 @@ def define_processing_col_groups():
     columns_to_normalize = [item for sublist in thematic_lists.values() for item in sublist]
     reverse = ['RD_DENSUNREV', 'USAID_PRECIP']
     return(core_columns, columns_to_normalize, reverse, thematic_lists)
+
+# Define core columns and columns to rank with reverse exception (once; the functions below read these module-level lists)
+core_columns, columns_to_normalize, reverse, thematic_lists = define_processing_col_groups()
     
-def create_zscore_index(sdf, weights_dict):
-    ''' First, this function loops through the columns to normalize list, calculates a new column based on the z-score, 
-    and then multiplies it by the weight. The weight is either the default (0.1) or provided via a weights_dict. If a column
-    is also in the reverse list, then the z score is multiplied by -1. After the normalized and weighted columns are created,
-    they are summed to create the index of need. Lastly, we calculate the percentile of this index to more readily compare
-    the results of different weighting schemes.'''
-    core_columns, columns_to_normalize, reverse, thematic_lists = define_processing_col_groups()
-    normalized_df = pd.DataFrame()
-    # Loop through columns to normalize
-    for column in columns_to_normalize:
-        normalized_df[column] = sdf[column]
-        is_reverse = column in reverse
-        normalized_col_suffix = '_normalized' 
-        normalized_df[column + normalized_col_suffix] = -zscore(sdf[column]) if is_reverse else zscore(sdf[column])
-        weight_col_suffix = '_weight'
-        weight_value = 0.1 if weights_dict is None else weights_dict[column]
-        normalized_df[column + weight_col_suffix] = weight_value
-        final_suffix = "_weighted_zscore"
-        normalized_df[column + final_suffix] = normalized_df[column + normalized_col_suffix]  * normalized_df[column + weight_col_suffix]
-    normalized_df['INDEX_OF_NEED'] = round(normalized_df.filter(like=final_suffix, axis=1).sum(axis=1),4)
-    normalized_df['INDEX_OF_NEED_percentile'] = round(normalized_df['INDEX_OF_NEED'].rank(pct=True) * 100)
-    result_df = pd.concat([sdf[core_columns], normalized_df], axis=1)
-    return result_df
-
-def create_INDEX_OF_NEED(df, weights_dict):
-    '''This function creates a new dataframe with the index of need and percentile that has columns sorted for easier viewing.'''
+@st.cache_resource
+def load_zscore_matrix(geojson_path):
+    ''' This function standardizes the columns to normalize once per dataset and caches the result. The z-scores only depend 
+    on the loaded geojson (not on the weights), so slider submits can reuse this matrix. If a column is also in the reverse list, 
+    then the z score is multiplied by -1 (via a sign vector). The matrix is shared across reruns and sessions without being 
+    copied (st.cache_resource), so it is marked read-only.'''
+    sdf = load_geopandas_df(geojson_path)
+    # float32 is ample precision for an index rounded to 4 decimals and halves the memory traffic
+    values = sdf[columns_to_normalize].to_numpy(dtype=np.float32)
+    signs = np.where(np.isin(columns_to_normalize, reverse), -1.0, 1.0).astype(np.float32)
+    # Population standard deviation (ddof=0) to match scipy.stats.zscore
+    normalized = (values - values.mean(axis=0)) / values.std(axis=0) * signs
+    normalized.setflags(write=False)
+    return normalized
+
+def define_output_column_order():
+    ''' The index of need dataframe leads with the ID, commune, index, and percentile columns, and the remaining columns are 
+    sorted for easier viewing. This order never changes, so it is computed once and used to build the dataframe directly.'''
+    leading_columns = ['OBJECTID','ADM3_EN','INDEX_OF_NEED','INDEX_OF_NEED_percentile']
+    suffixes = ['', '_normalized', '_weight', '_weighted_zscore']
+    other_columns = core_columns + [column + suffix for column in columns_to_normalize for suffix in suffixes]
+    return(leading_columns + sorted(column for column in other_columns if column not in leading_columns))
+
+@st.cache_resource
+def define_slider_spec():
+    ''' The sidebar shows one slider per indicator, grouped by theme and sorted by alias within each theme. The themes, labels and 
+    help texts never change, so the (theme, ((column, label, help), ...)) tuples are built once per process instead of on every rerun.'''
+    return(tuple(
+        (key, tuple((column, widget_alias_dict[column], f'Variable Name: {column} | Source: {hover_source_dict[column]}')
+                    for column in sorted(value, key=lambda x: widget_alias_dict[x])))
+        for key, value in thematic_lists.items()
+    ))
+
+def create_zscore_index(sdf, normalized, weights_dict):
+    ''' This function multiplies the cached z-score matrix (see load_zscore_matrix) by the weights. The weight is either the 
+    default (0.1) or provided via a weights_dict. The index of need is the matrix product of the normalized values and the 
+    weights. Lastly, we calculate the percentile of this index to more readily compare the results of different weighting 
+    schemes. The result is built in one pass in output_column_order rather than concatenated and re-sorted.'''
+    weights = np.array([0.1 if weights_dict is None else weights_dict[column] for column in columns_to_normalize], dtype=np.float32)
+    weighted = normalized * weights
+    # The index itself is kept as a rounded float64 so the table and tooltip show clean 4 decimal values
+    index_of_need = np.round((normalized @ weights).astype(np.float64), 4)
+    # Percentile = average rank / count, as with pandas rank(pct=True) (tied communes share a rank); 0-100 fits in an int8
+    ranks = rankdata(index_of_need, method='average')
+    data = {column: sdf[column] for column in core_columns + columns_to_normalize}
+    # Each derived quantity is kept as one (rows x indicators) array; per-column names are only attached here
+    derived = {
+        '_normalized': normalized,
+        '_weight': np.broadcast_to(weights, normalized.shape),
+        '_weighted_zscore': weighted,
+    }
+    for suffix, matrix in derived.items():
+        data.update(zip([column + suffix for column in columns_to_normalize], matrix.T))
+    data['INDEX_OF_NEED'] = index_of_need
+    data['INDEX_OF_NEED_percentile'] = np.round(ranks * (100.0 / len(ranks))).astype(np.int8)
+    return pd.DataFrame(data, columns=output_column_order, index=sdf.index)
+
+def create_INDEX_OF_NEED(df, normalized, weights_dict):
+    '''This function creates a new geodataframe with the index of need and percentile. Columns are already sorted for easier
+    viewing by create_zscore_index.'''
     # Create Weighted Vulnerablity Index
-    df = create_zscore_index(df , weights_dict=weights_dict)
-    df.set_index(['OBJECTID','ADM3_EN','INDEX_OF_NEED','INDEX_OF_NEED_percentile'], inplace=True)
-    df = df.reindex(sorted(df.columns), axis=1)
-    df.reset_index(inplace=True)
-    df = gpd.GeoDataFrame(df, geometry = 'geometry')
-    return(df)
+    df = create_zscore_index(df, normalized, weights_dict=weights_dict)
+    # copy=False wraps the freshly built frame instead of copying every column again
+    return(gpd.GeoDataFrame(df, geometry = 'geometry', copy=False))
+
+@st.cache_data(max_entries=16)
+def load_INDEX_OF_NEED(geojson_path, weights_tuple):
+    '''This function caches the index of need for a set of weights. The weights are passed as a tuple ordered like 
+    columns_to_normalize (or None for the default weights) so that repeated submits with the same slider positions are a cache hit.'''
+    weights_dict = None if weights_tuple is None else dict(zip(columns_to_normalize, weights_tuple))
+    return create_INDEX_OF_NEED(load_geopandas_df(geojson_path), load_zscore_matrix(geojson_path), weights_dict)
+
+@st.cache_data(max_entries=16)
+def load_display_df(geojson_path, weights_tuple):
+    '''This function caches the table view of the index of need (indexed by OBJECTID, without geometry) for a set of weights, 
+    so the set_index/drop copies are not repeated on every rerun.'''
+    df = load_INDEX_OF_NEED(geojson_path, weights_tuple)
+    # Dropping the geometry column already yields a plain pandas DataFrame
+    return(df.drop(columns=['geometry']).set_index('OBJECTID'))
 
-def render_map(df, choropleth_name):
+@st.cache_data
+def load_map_center(geojson_path):
+    '''This function calculates the map center from the bounding box of the communes. The geometry never changes between
+    weightings, so this is computed once per dataset rather than on every map render.'''
+    bbox = load_geopandas_df(geojson_path).total_bounds
+    return([(bbox[1] + bbox[3]) / 2, (bbox[0] + bbox[2]) / 2])
+
+def render_map(df, choropleth_name, map_center):
     '''This function renders a choropleth map with custom html based on the geometry and vulerability index percentile columns'''
     normalized_cols = [col for col in df.columns if col.endswith('_normalized')]
-    # Get the bounding box of the GeoDataFrame
-    bbox = df.total_bounds
-    # Calculate the center of the bounding box
-    map_center = [(bbox[1] + bbox[3]) / 2, (bbox[0] + bbox[2]) / 2]
-    # Create Map Object
+    # Only serialize the columns used by the choropleth and tooltip into the map HTML
+    df_map = df[['ADM3_EN','INDEX_OF_NEED','INDEX_OF_NEED_percentile','geometry']]
+    # Serialize to GeoJSON with orjson rather than the stdlib encoder
+    geojson_obj = orjson.loads(orjson.dumps(df_map.to_geo_dict(), option=orjson.OPT_SERIALIZE_NUMPY))
+    # Create Map Object (prefer_canvas draws the commune polygons on a single canvas instead of one SVG path each)
     m1= folium.Map(location=map_center, zoom_start=7,
-                   tiles=None)
-    tile = folium.TileLayer(
-        tiles = 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
-        attr = 'Esri',
-        name = 'Esri Satellite',
-        overlay = False,
-        control = True
-       ).add_to(m1)
-    # Create a choropleth map based on the specified column
-    choropleth_layer = folium.Choropleth(
-        geo_data= df,
+                   tiles=None, prefer_canvas=True)
+    folium.TileLayer(**esri_satellite_tiles).add_to(m1)
+    # Colour each commune straight from its embedded percentile property (fixed decile bins, so no data join or bin scan).
+    # This also colours communes that share an ADM3_EN name correctly, which a key_on join by name could not.
+    choropleth_layer = folium.GeoJson(
+        geojson_obj,
         name = choropleth_name,
-        data = df,
-        columns=['ADM3_EN','INDEX_OF_NEED_percentile'],
-        # key_on='feature.id',
-        key_on='feature.properties.ADM3_EN',
-        fill_color='RdYlBu_r',
-        fill_opacity=0.7,
-        line_opacity=0.5,
-        legend_name='Index of Need (Percentile)',
-        # legend_name = 'Custom Legend',
-        highlight = True,
-        style_function=lambda x: {'weight': 1, 'color': 'white', 'fillOpacity': 1.0},
+        style_function = lambda feature: {
+            'weight': 1,
+            'opacity': 0.5,
+            'color': 'black',
+            'fillOpacity': 0.7,
+            'fillColor': percentile_colors[min(feature['properties']['INDEX_OF_NEED_percentile'] // 10, 9)],
+        },
+        highlight_function = lambda feature: {'weight': 3, 'fillOpacity': 0.9},
+        # Let Leaflet simplify the commune outlines further (in screen pixels) when drawing
+        smooth_factor = 2.0,
     ).add_to(m1)
+    # Add the legend for the decile colours
+    StepColormap(percentile_colors, index=list(range(0, 101, 10)), vmin=0, vmax=100,
+                 caption='Index of Need (Percentile)').add_to(m1)
     
-    # Create a custom CSS style for the legend control
-    legend_style = """
-    <style>
-        .leaflet-control.legend {
-            background-color: rgba(0,0,0,0.6);  /* Background color */
-            color: white; /* Text color */
-            border: 1px solid #333;
-            border-radius: 2px;
-            padding: 2px;
-        }
-    
-        .leaflet-control.legend .key {
-          fill: white; /* Text color within the key class*/
-        }
-    
-    </style>
-    """
-    # Add the custom CSS style to the choropleth layer's HTML content
+    # Add the custom CSS style to the legend's HTML content
     m1.get_root().html.add_child(folium.Element(legend_style))
     
-    # Add GeoJson layer with pop-ups
-    folium.GeoJson(
-        df,
-        name='pup',
-        style_function=lambda x: {'fillOpacity': 0, 'color': 'transparent', 'weight': 0},
-        highlight_function=lambda x: {'weight': 3, 'color': 'white'},
-        tooltip=folium.GeoJsonTooltip(fields=
-          ['ADM3_EN','INDEX_OF_NEED','INDEX_OF_NEED_percentile'], aliases=['Commune', "VI", "VI Percentile"]
-                                      ),
-        # popup=folium.GeoJsonPopup(
-        #     fields = ['ADM3_EN','INDEX_OF_NEED','INDEX_OF_NEED_percentile'] + normalized_cols,
-        #     aliases=['Commune', "ION", "ION Percentile"] + normalized_cols,
-        #     max_width=600, max_height=200, sticky=False
-        #     ), 
-        control= False
-    ).add_to(m1)
+    # Add pop-ups to the choropleth's own GeoJson layer rather than a second, transparent copy of every commune
+    choropleth_layer.add_child(
+        folium.GeoJsonTooltip(fields=
+          ['ADM3_EN','INDEX_OF_NEED','INDEX_OF_NEED_percentile'], aliases=['Commune', "VI", "VI Percentile"],
+          # Open the tooltip at the commune rather than re-positioning it on every mouse move
+          sticky=False
+                              )
+    )
+    # choropleth_layer.add_child(
+    #     folium.GeoJsonPopup(
+    #         fields = ['ADM3_EN','INDEX_OF_NEED','INDEX_OF_NEED_percentile'] + normalized_cols,
+    #         aliases=['Commune', "ION", "ION Percentile"] + normalized_cols,
+    #         max_width=600, max_height=200, sticky=False
+    #         )
+    # )
     
     # Add Esri Map Labels
-    map_labels = folium.TileLayer(
-        tiles = 'https://services.arcgisonline.com/ArcGIS/rest/services/Reference/World_Boundaries_and_Places/MapServer/tile/{z}/{y}/{x}',
-        attr = 'Esri',
-        name = 'Esri World Boundaries and Places',
-        overlay = True,
-        show = True,
-        control = True
-    )
-    map_labels.add_to(m1)
+    folium.TileLayer(**esri_labels_tiles).add_to(m1)
     
     # Add to Layer Control
     folium.LayerControl().add_to(m1)
@@ -253,62 +331,73 @@ def render_map(df, choropleth_name):
     # folium_static(m1._repr_html_(), width=725, returned_objects=[])
     return(m1)
 
-def render_piechart(df, column_list):
-    # Create Pie Chart
-    thematic_weights_dict = {}
-    for key, value in thematic_lists.items():
-        weight_cols = [item + "_weight" for item in value]
-        thematic_sum = weighted_df[weight_cols].iloc[0].sum()
-        thematic_weights_dict[key] = thematic_sum
-    data = pd.DataFrame(list(thematic_weights_dict.items()), columns=['Themes', 'Weights'])
-    fig = px.pie(data, names='Themes', values='Weights')
-    st.plotly_chart(fig)
-  
-def download_map(map_to_download, map_title, timestamp):
-    '''Creates and displays a download link for map as HTML File.'''
+def hash_map_columns(df):
+    '''This function hashes the columns that drive the map (commune, index, percentile) so it can be used as a cache key.'''
+    map_columns = df[['ADM3_EN','INDEX_OF_NEED','INDEX_OF_NEED_percentile']]
+    return hashlib.blake2b(pd.util.hash_pandas_object(map_columns, index=False).values.tobytes()).hexdigest()
+
+@st.cache_data(max_entries=16)
+def render_map_html(_df, df_hash, choropleth_name, map_center):
+    '''This function caches the HTML of the rendered map. The dataframe is not hashed by Streamlit (leading underscore), 
+    so the df_hash from hash_map_columns is used as the cache key instead.'''
+    return render_map(_df, choropleth_name, map_center)._repr_html_()
+
+@st.cache_resource
+def load_unweighted_index(geojson_path, map_title):
+    '''This function builds the unweighted (default weights) index of need and its map HTML once per process. Unlike 
+    st.cache_data, st.cache_resource hands back the same objects on every rerun instead of unpickled copies, so they must 
+    not be modified in place.'''
+    df = load_INDEX_OF_NEED(geojson_path, weights_tuple=None)
+    return(df, render_map_html(df, hash_map_columns(df), map_title, load_map_center(geojson_path)))
+
+@st.cache_data(max_entries=16)
+def create_piechart(weights_tuple):
+    '''This function sums the slider weights of each theme and returns the shares as a pie chart figure. Themes are contiguous 
+    blocks of columns_to_normalize, so the sums are a single reduceat over the weight vector. The figure is cached per weights tuple.'''
+    # plotly is only needed once weights are submitted, so it is imported here rather than on every cold start
+    import plotly.express as px
+    data = pd.DataFrame({'Themes': list(thematic_lists), 'Weights': np.add.reduceat(np.array(weights_tuple), theme_boundaries)})
+    return(px.pie(data, names='Themes', values='Weights'))
+
+def render_piechart(weights_tuple):
+    '''This function displays the thematic weights pie chart for a weights tuple ordered like columns_to_normalize.'''
+    st.plotly_chart(create_piechart(weights_tuple))
+
+def download_map(map_html, map_title, timestamp):
+    '''Creates and displays a download button for the (already rendered) map HTML as an HTML File.'''
     html_name = f'{map_title} ({timestamp}).html'
-    map_html = map_to_download._repr_html_()
-    # Convert the HTML to bytes and encode as base64
-    html_bytes = map_html.encode('utf-8')
-    b64 = base64.b64encode(html_bytes)
-    payload = b64.decode()
-    # Create a data URL
-    data_url = f'data:text/html;base64,{payload}'
-    # Create a download link using Streamlit
-    st.markdown(f'<a href="{data_url}" download="{html_name}" target="_blank">Click to Download Map as an HTML File</a>', unsafe_allow_html=True)
-
-# def download_dataframe(df, csv_name, timestamp):
+    # Serve the raw HTML bytes through Streamlit rather than base64-encoding them into a data URL
+    st.download_button(label='Click to Download Map as an HTML File', data=map_html.encode('utf-8'), file_name=html_name, mime='text/html')
+
+# import base64
+
+# @st.cache_data(max_entries=16)
+# def create_csv_payload(_df, weights_tuple):
+#     '''Caches the base64 CSV payload for a set of weights (the dataframe itself is not hashed).'''
+#     csv_str = _df.drop(columns=['geometry']).to_csv(index=False)
+#     return base64.b64encode(csv_str.encode('utf-8')).decode()
+
+# def download_dataframe(df, weights_tuple, csv_name, timestamp):
 #     '''Creates and displays a download link for the dataframe as a CSV File.'''
 #     filename = f'{csv_name} ({timestamp}).csv'
-#     dynamic_vars = {}
-#     # Setting the DataFrame as the value for 'dynamic_var' key
-#     dynamic_vars[f'df_{timestamp}'] = df.copy()
-#     dynamic_vars[f'df_{timestamp}'].set_index('OBJECTID',inplace=True)
-#     csv_str = dynamic_vars[f'df_{timestamp}'].loc[:, ~dynamic_vars[f'df_{timestamp}'].columns.isin(['geometry'])].to_csv(index=False)
-#     csv_bytes = csv_str.encode('utf-8')
-#     b64 = base64.b64encode(csv_bytes)
-#     payload = b64.decode()
+#     payload = create_csv_payload(df, weights_tuple)
 #     st.markdown(f'<a download="{filename}" href="data:text/csv;base64,{payload}" target="_blank">Download CSV with updated indicator weights and weighted index of need {timestamp}</a>', unsafe_allow_html=True)  
     
 # Setup Streatmlit Tabs
 tab2, tab1, tab3 = st.tabs(["Index Maker", "Illustrative Example (equal weights)", "Indicator Explorer"])
 
-# Define core columns and columns to rank with reverse exception
-core_columns, columns_to_normalize, reverse, thematic_lists = define_processing_col_groups()
+# Define the (fixed) column order of the index of need dataframe
+output_column_order = define_output_column_order()
+# Define the start position of each theme within columns_to_normalize (used to sum weights per theme)
+theme_boundaries = np.cumsum([0] + [len(value) for value in thematic_lists.values()])[:-1]
 
-# Load geopandas dataframe 
-gdf = load_geopandas_df(geojson_path)
-# Create unweighted index of need dataframe
-root_df = create_INDEX_OF_NEED(gdf, weights_dict=None)
-# Load Map and Map HTML
+# Create unweighted index of need dataframe and its Map HTML (built once per process, see load_unweighted_index)
 map_title = 'Unweighted Index of Need'
-m1 = render_map(root_df, map_title)
-# Display the Folium map using st.components.html
-map_html = m1._repr_html_()
+root_df, map_html = load_unweighted_index(geojson_path, map_title)
 
 # Create a dictionary to store the input widgets
 weights_dict = {}
-# Set Alias Dict (This Dict is inverted later on)
+# Set Alias Dict (keyed by column name, so slider labels are a direct O(1) lookup)
 widget_alias_dict = {
     'USAID_PRECIP': 'Average Cumulative Precipitation per Square Kilometer during 2016 - 2023 Growing Season (Reversed)',
     'USAID_IPC': 'Average IPC Scores from 2020-2023',
@@ -332,7 +421,7 @@ widget_alias_dict = {
     # 'CON_NDFAC2': 'Non-Dahalo Flag Actor 2 (Sum)',
 }
 
-# Set Alias Dict (This Dict is inverted later on)
+# Set Source Dict (keyed by column name; used for the slider help text)
 hover_source_dict = {
     'USAID_PRECIP': 'Climate Hazards Group InfraRed Precipitation with Station Data (CHIRPS) Daily via Google Earth Engine (GEE) 2016-2023',
     'USAID_IPC': 'Famine Early Warning Systems Network (FEWS-NET) 2020-2023',
@@ -360,15 +449,14 @@ hover_source_dict = {
 with st.sidebar:
     with st.form("Weight Sliders"):
         st.title("Indicator Weight Slider")
-        # Iterate over Thematic Lists Dictionary
-        for key, value in thematic_lists.items():
+        # Iterate over the themes and their (alias-sorted) slider labels and help texts
+        for key, sliders in define_slider_spec():
             st.subheader(key)
-            # Sort columns by Alias Name
-            for column in sorted(value, key=lambda x: widget_alias_dict [x]):
-                weights_dict[f'{column}'] = st.slider(
-                    # Use the widget_alias_dict to remap the column names. 
-                    label = widget_alias_dict[column],
-                    help = f'Variable Name: {column} | Source: {hover_source_dict[column]}',
+            for column, label, help_text in sliders:
+                weights_dict[column] = st.slider(
+                    # The label is the column's alias from widget_alias_dict
+                    label = label,
+                    help = help_text,
                     min_value=0.0,
                     max_value=1.0,
                     value= 0.1,
@@ -379,26 +467,24 @@ with st.sidebar:
 
 # Initialize session state
 if 'tab1_data' not in st.session_state:
-    st.session_state.tab1_data = {'result': None, 'map_html': None, 'timestamp': None}
+    st.session_state.tab1_data = {'result': None, 'timestamp': None}
 
 # Display Unweighted Map and DataFrame
 with tab1:
     st.subheader("Illustrative Example (equal weights)")
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     # Check if the data for Tab 1 is already calculated
     if st.session_state.tab1_data['result'] is None:        
-        # Store the data in session state
-        st.session_state.tab1_data['result'] = root_df
-        st.session_state.tab1_data['map_html'] = map_html
-        st.session_state.tab1_data['timestamp'] = timestamp
+        # Store the data in session state (the timestamp is only formatted on the first run)
+        st.session_state.tab1_data['result'] = load_display_df(geojson_path, weights_tuple=None)
+        st.session_state.tab1_data['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     with st.container():
-        # Display the HTML components
-        components.html(st.session_state.tab1_data['map_html'], width=800, height=500, scrolling=True)
+        # Display the HTML components (the map HTML comes from the process-wide cache, see load_unweighted_index, so it is not copied into session state)
+        components.html(map_html, width=800, height=500, scrolling=True)
         # Display the dataframe
         st.subheader(f"{map_title} Dataframe:")
-        st.dataframe(st.session_state.tab1_data['result'].set_index('OBJECTID').drop(columns=['geometry']), width=800)
+        st.dataframe(st.session_state.tab1_data['result'], width=800)
         
     st.markdown("""
     ---
@@ -409,41 +495,36 @@ with tab1:
     """
                )
 
-# # Initialize session state
-# if 'tab2_data' not in st.session_state:
-#     st.session_state.tab2_data = {'result2': None, 'map_html2': None, 'timestamp2': None}       
+# Initialize session state (the weights of the last submit and the map HTML built for them)
+if 'tab2_data' not in st.session_state:
+    st.session_state.tab2_data = {'weights_tuple': None, 'map_html2': None}
 # Display Weighted Map and DataFrame
 with tab2:
     # Re-run .py if submitted and add map to tab2
     if submitted:       
         # Render Weighted Tab
-        weighted_df = create_INDEX_OF_NEED(gdf, weights_dict)
-        # Load Map and Map HTML
+        weights_tuple = tuple(weights_dict[column] for column in columns_to_normalize)
         map_title2 = 'Index Maker'
-        m2 = render_map(weighted_df, map_title2)
-        # Display the Folium map using st.components.html
-        map_html2 = m2._repr_html_()
+        # Only rebuild the index and its map when the weights changed since the last submit
+        if st.session_state.tab2_data['weights_tuple'] != weights_tuple:
+            weighted_df = load_INDEX_OF_NEED(geojson_path, weights_tuple)
+            # Load Map HTML and store it with its weights in session state
+            st.session_state.tab2_data['map_html2'] = render_map_html(weighted_df, hash_map_columns(weighted_df), map_title2, load_map_center(geojson_path))
+            st.session_state.tab2_data['weights_tuple'] = weights_tuple
         # Render the map, dataframe, and piechart on Weighted VI Tab
         with tab2:
             st.subheader(map_title2)
             timestamp2 = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            # # Check if the data for Tab 1 is already calculated
-            # if st.session_state.tab2_data['result2'] is None:        
-            #     # Store the data in session state
-            #     st.sessieon_state.tab2_data['result2'] = weighted_df
-            #     st.session_state.tab2_data['map_html2'] = map_html2
-            #     st.session_state.tab2_data['timestamp2'] = timestamp2
                 
             with st.container():
-                components.html(map_html2, width=800, height=500, scrolling = True)
-                # components.html(st.session_state.tab2_data['map_html2'], width=800, height=500, scrolling = True)
-                # download_map(m2, map_title2, timestamp2)
+                # Display the Folium map using st.components.html
+                components.html(st.session_state.tab2_data['map_html2'], width=800, height=500, scrolling = True)
+                # download_map(st.session_state.tab2_data['map_html2'], map_title2, timestamp2)
                 st.subheader(f"{map_title2} Dataframe:")
-                st.dataframe(weighted_df.set_index('OBJECTID').drop(columns=['geometry']), width=800)
-                # st.dataframe(st.session_state.tab2_data['result2'].set_index('OBJECTID').drop(columns=['geometry']), width=800)
-                # download_dataframe(weighted_df, map_title2, timestamp2)
+                st.dataframe(load_display_df(geojson_path, weights_tuple), width=800)
+                # download_dataframe(weighted_df, weights_tuple, map_title2, timestamp2)
                 st.subheader('Thematic Influence on Weighted Index of Need Pie Chart')
-                render_piechart(weighted_df, thematic_lists)
+                render_piechart(weights_tuple)
         
         st.toast('The Index Maker Tab has been updated!', icon="🗺️")
 
@@ -0,0 +1,54 @@
+// Service worker for the Leaflet map component. It keeps the vendored Leaflet files in the Cache API, so they survive page
+// reloads and are served from disk instead of the network. OSM tiles are left to the browser HTTP cache, which follows the
+// tile servers' Cache-Control/Expires headers as the OSM tile usage policy asks.
+
+// Bump the version when the vendored Leaflet/Leaflet.draw files change, so the old copies are dropped on activate
+var assetCacheName = 'leaflet-assets-v1';
+// Tile cache written by earlier versions of this worker; deleted on activate
+var oldTileCacheName = 'osm-tiles';
+
+self.addEventListener('install', function (event) {
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', function (event) {
+    event.waitUntil(
+        caches.keys().then(function (names) {
+            return Promise.all(names.filter(function (name) {
+                return (name.indexOf('leaflet-assets-') === 0 && name !== assetCacheName) || name === oldTileCacheName;
+            }).map(function (name) {
+                return caches.delete(name);
+            }));
+        }).then(function () {
+            // Take control of the already open map without a reload
+            return self.clients.claim();
+        })
+    );
+});
+
+// Serve from the cache when possible; otherwise fetch, and store successful responses
+function cacheFirst(request, cacheName) {
+    return caches.open(cacheName).then(function (cache) {
+        return cache.match(request).then(function (cached) {
+            if (cached) {
+                return cached;
+            }
+            return fetch(request).then(function (response) {
+                if (response.ok) {
+                    cache.put(request, response.clone());
+                }
+                return response;
+            });
+        });
+    });
+}
+
+self.addEventListener('fetch', function (event) {
+    var url = new URL(event.request.url);
+    if (event.request.method !== 'GET') {
+        return;
+    }
+    if (url.origin === self.location.origin && /\/(leaflet|leaflet-draw)\//.test(url.pathname)) {
+        event.respondWith(cacheFirst(event.request, assetCacheName));
+    }
+});
@@ -1,70 +1,32 @@
 import streamlit as st
 import streamlit.components.v1 as components
-
-# HTML and JS for the Leaflet map
-leaflet_map_html = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Leaflet Draw Example</title>
-    <link rel="stylesheet" href="https://unpkg.com/leaflet/dist/leaflet.css" />
-    <link rel="stylesheet" href="https://unpkg.com/leaflet-draw/dist/leaflet.draw.css"/>
-    <script src="https://unpkg.com/leaflet/dist/leaflet.js"></script>
-    <script src="https://unpkg.com/leaflet-draw/dist/leaflet.draw.js"></script>
-    <style>
-        #map { height: 400px; }
-    </style>
-</head>
-<body>
-    <div id="map"></div>
-    <script>
-        var map = L.map('map').setView([51.505, -0.09], 13);
-        L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
-            maxZoom: 19,
-            attribution: '© OpenStreetMap'
-        }).addTo(map);
-
-        // FeatureGroup is where we will store editable layers
-        var drawnItems = new L.FeatureGroup();
-        map.addLayer(drawnItems);
-
-        var drawControl = new L.Control.Draw({
-            edit: {
-                featureGroup: drawnItems
-            },
-            draw: {
-                polygon: true,
-                polyline: false,
-                rectangle: false,
-                circle: false,
-                circlemarker: false,
-            }
-        });
-        map.addControl(drawControl);
-
-        map.on(L.Draw.Event.CREATED, function (event) {
-            var layer = event.layer;
-            drawnItems.addLayer(layer);
-
-            // Convert the drawn layer to GeoJSON
-            var drawnGeoJSON = layer.toGeoJSON();
-            console.log(drawnGeoJSON);
-
-            // Ideally, here you would send the GeoJSON data back to your Streamlit app's server
-            // This requires a custom Streamlit component
-        });
-    </script>
-</body>
-</html>
-
-"""
-
+from pathlib import Path
+
+# The Leaflet map is a custom component (frontend/index.html, with Leaflet 1.9.3 and Leaflet.draw 1.0.4 vendored next to it).
+# Unlike components.html, its iframe stays mounted across reruns, so Leaflet boots once and only receives new arguments.
+@st.cache_resource
+def load_leaflet_map_component():
+    '''This function declares the Leaflet map component once per process and returns it, rather than re-declaring 
+    (and re-registering) it on every rerun of this script.'''
+    return(components.declare_component('leaflet_map', path=str(Path(__file__).parent / 'frontend')))
+
+
+@st.fragment
+def map_fragment():
+    '''This function renders the Leaflet map and the shapes drawn on it. As a fragment, drawing on the map (which sends a 
+    new component value) only reruns this function rather than the whole page.'''
+    # Render the Leaflet map component; it returns the drawn shapes as a GeoJSON FeatureCollection (None until something is drawn)
+    # The zoom range and bounds keep the demo map to the London area, which caps the number of tiles it can request
+    # (zoom levels above 16 reuse the z16 tiles, see maxNativeZoom in frontend/index.html)
+    drawn_geojson = load_leaflet_map_component()(center=[51.505, -0.09], zoom=13, min_zoom=10, max_zoom=19, max_bounds=[[51.28, -0.5], [51.70, 0.25]],
+                                                    key='map', default=None)
+    if drawn_geojson is not None:
+        st.json(drawn_geojson)
 
 def main():
     st.title("Streamlit Leaflet Map Integration")
 
-    # Use the `components.html` function to render the custom HTML/JS for the Leaflet map
-    components.html(leaflet_map_html, height=450)
+    map_fragment()
 
 if __name__ == "__main__":
     main()
@@ -72,20 +34,53 @@ if __name__ == "__main__":
 
 # import streamlit as st
 # import geopandas as gpd
+# import pandas as pd
 # import requests
-# from shapely.geometry import shape
-
-# def fetch_data():
+# import io
+# import re
+# from concurrent.futures import ThreadPoolExecutor
+
+# # One session per process (this script re-runs on every interaction), so repeated fetches reuse the TLS connection to ArcGIS
+# @st.cache_resource
+# def load_session():
+#     return requests.Session()
+
+# def check_arcgis_response(response):
+#     ''' Raises for a failed request, including the {"error": {...}} body ArcGIS returns with a 200 status (e.g. when a 
+#     request is throttled), so the caller never parses an error as data.'''
+#     response.raise_for_status()
+#     # Only the start of the body is checked, so a full GeoJSON page is not parsed twice
+#     if re.match(rb'\s*\{\s*"error"\s*:', response.content[:100]):
+#         error = response.json()['error']
+#         raise requests.HTTPError(f"ArcGIS query failed ({error.get('code')}): {error.get('message')} {error.get('details', '')}", response=response)
+
+# @st.cache_data(ttl=3600)
+# def fetch_data(out_fields='*'):
+#     ''' Fetches the ArcGIS layer as a GeoDataFrame. Pass out_fields as a comma separated list of only the fields the app 
+#     displays (e.g. 'GEOID,NAME'); every extra attribute is repeated for every feature in the response.'''
 #     url = "https://services.arcgis.com/cJ9YHowT8TU7DUyn/arcgis/rest/services/epa_ira/FeatureServer/0/query"
 #     params = {
 #         'where': '1=1',  # Modify this as needed to filter the data
-#         'outFields': '*',  # Adjust the fields you need
+#         'outFields': out_fields,  # Adjust the fields you need
 #         'outSR': '4326',  # EPSG code for WGS84
+#         'geometryPrecision': 5,  # Round coordinates to 5 decimals (~1 m), which is plenty for display
 #         'f': 'geojson'  # Fetches the data in GeoJSON format
 #     }
-#     response = requests.get(url, params=params)
-#     data = response.json()
-#     gdf = gpd.GeoDataFrame.from_features(data["features"])
+#     # A single query stops at the service's maxRecordCount, so count the features first and fetch them in pages (in parallel)
+#     page_size = 2000
+#     count_response = load_session().get(url, params={**params, 'returnCountOnly': 'true', 'f': 'json'}, timeout=30)
+#     check_arcgis_response(count_response)
+#     count = count_response.json()['count']
+
+#     def fetch_page(offset):
+#         response = load_session().get(url, params={**params, 'resultOffset': offset, 'resultRecordCount': page_size}, timeout=30)
+#         check_arcgis_response(response)
+#         # Parse the GeoJSON bytes with GDAL (pyogrio) rather than building a shapely geometry per feature in Python
+#         return gpd.read_file(io.BytesIO(response.content), engine='pyogrio')
+
+#     with ThreadPoolExecutor(max_workers=8) as executor:
+#         pages = list(executor.map(fetch_page, range(0, count, page_size)))
+#     gdf = pd.concat(pages, ignore_index=True) if pages else gpd.GeoDataFrame()
 #     return gdf
 
 # def main():